@@ -1,13 +1,9 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import yfinance as yf
+import altair as alt
 import requests
-from bs4 import BeautifulSoup
-from fpdf import FPDF
-import matplotlib.pyplot as plt
-from io import BytesIO
-import numpy_financial as npf
+import datetime
 
 st.set_page_config(page_title="Tilenga Fiscal Sensitivity Dashboard", layout="wide")
 
@@ -21,17 +17,44 @@ This tool allows the Business Development team at TotalEnergies EP Uganda to eva
 
 # ----------------------
 # FETCH REAL ECONOMIC DATA SAFELY
+# yfinance-cache keeps price history on disk, so one Ticker is shared by every session
+@st.cache_resource
+def get_ticker():
+    import yfinance_cache as yfc
+    return yfc.Ticker("BZ=F")
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_oil_price():
+    # Errors propagate so a failed fetch is not cached and is retried on the next rerun.
+    # max_age matches the ttl; yfinance-cache would otherwise serve data up to 12 h old
+    oil_price_data = get_ticker().history(period="7d", interval="1d",
+                                          max_age=datetime.timedelta(hours=1))
+    return float(oil_price_data['Close'].dropna().iloc[-1])
+
+# Keep-alive HTTP session shared across reruns and sessions
+@st.cache_resource
+def get_http_session():
+    return requests.Session()
+
+# Fetch USD to UGX rate from exchangerate.host
+@st.cache_data(ttl=86400, show_spinner=False)
+def fetch_fx():
+    fx_response = get_http_session().get(
+        "https://api.exchangerate.host/latest?base=USD&symbols=UGX", timeout=5
+    )
+    fx_response.raise_for_status()
+    return fx_response.json().get('rates', {}).get('UGX', 3800)
+
 try:
-    oil_price_data = yf.download("BZ=F", period="7d", interval="1d")
-    latest_oil_price = oil_price_data['Close'].dropna().iloc[-1]
-    latest_oil_price = float(latest_oil_price)
-except Exception as e:
+    latest_oil_price = fetch_oil_price()
+except Exception:
     st.warning("⚠️ Could not fetch latest oil price. Using fallback value of $68.8")
     latest_oil_price = 68.80
 
-# Fetch USD to UGX rate from exchangerate.host
-fx_response = requests.get("https://api.exchangerate.host/latest?base=USD&symbols=UGX")
-usd_to_ugx = fx_response.json().get('rates', {}).get('UGX', 3800)
+try:
+    usd_to_ugx = fetch_fx()
+except Exception:
+    usd_to_ugx = 3800
 
 # ----------------------
 # SIDEBAR - INPUTS
@@ -51,30 +74,110 @@ project_life = st.sidebar.slider("Project Life (Years)", 5, 20, 10)
 # ----------------------
 # COMPUTATION
 # ----------------------
-annual_production = production * days_per_year
-revenue = oil_price * annual_production / 1e6  # in million $
-opex_total = opex_per_bbl * annual_production / 1e6
-royalty = revenue * royalty_rate / 100
-
-depreciation = capex * depreciation_rate / 100
-profit_before_tax = revenue - opex_total - depreciation - royalty
-tax = profit_before_tax * tax_rate / 100
-after_tax_profit = profit_before_tax - tax
-cash_flow = after_tax_profit + depreciation
-
-# Create projection over project life
-years = np.arange(1, project_life + 1)
-revenues = np.repeat(revenue, project_life)
-opex = np.repeat(opex_total, project_life)
-royalties = np.repeat(royalty, project_life)
-depreciations = np.repeat(depreciation, project_life)
-taxes = np.repeat(tax, project_life)
-cash_flows = np.repeat(cash_flow, project_life)
-
-# Discounted Cash Flows
-discounted_cash_flows = cash_flows / ((1 + discount_rate / 100) ** years)
-npv = npf.npv(discount_rate / 100, [-capex] + list(cash_flows))
-irr = npf.irr([-capex] + list(cash_flows)) * 100
+def annuity_pv(r, cf, n):
+    """Present value of n equal payments cf at rate r; r and cf broadcast as numpy arrays."""
+    near_zero = np.abs(r) < 1e-12
+    safe_r = np.where(near_zero, 1.0, r)
+    return np.where(near_zero, cf * n, cf * (1 - (1 + safe_r) ** -n) / safe_r)
+
+def irr_annuity(capex, cf, n):
+    """Solve capex = cf * (1 - (1+r)^-n) / r for r with Newton's method.
+
+    Falls back to bisection when Newton leaves (-1, inf) or does not converge;
+    returns nan when no positive investment / positive cash flow pair exists.
+    """
+    if capex <= 0 or cf <= 0:
+        return float("nan")
+    r = cf / capex - 1 / n
+    if abs(r) < 1e-6:
+        r = 1e-6
+    for _ in range(50):
+        v = (1 + r) ** -n
+        f = cf * (1 - v) / r - capex
+        fp = cf * (n * v / (1 + r) * r - (1 - v)) / r ** 2
+        step = f / fp
+        r -= step
+        if r <= -1 or abs(r) < 1e-12:
+            break
+        if abs(step) < 1e-10:
+            return r
+
+    # The annuity PV falls monotonically from +inf at r=-1 to 0, so bisection always brackets
+    lo, hi = -1 + 1e-9, 1.0
+    while annuity_pv(hi, cf, n) > capex:
+        hi *= 2
+    for _ in range(200):
+        mid = (lo + hi) / 2
+        if annuity_pv(mid, cf, n) > capex:
+            lo = mid
+        else:
+            hi = mid
+        if hi - lo < 1e-12:
+            break
+    return (lo + hi) / 2
+
+def annual_cash_flow(oil_price, production, capex, opex_per_bbl, depreciation_rate,
+                     royalty_rate, tax_rate):
+    """Annual fiscal breakdown in million $; oil_price may be a scalar or a numpy array."""
+    annual_production = production * days_per_year
+    revenue = oil_price * annual_production / 1e6  # in million $
+    opex_total = opex_per_bbl * annual_production / 1e6
+    royalty = revenue * royalty_rate / 100
+
+    depreciation = capex * depreciation_rate / 100
+    profit_before_tax = revenue - opex_total - depreciation - royalty
+    tax = profit_before_tax * tax_rate / 100
+    after_tax_profit = profit_before_tax - tax
+    cash_flow = after_tax_profit + depreciation
+
+    return {
+        "revenue": revenue,
+        "opex_total": opex_total,
+        "royalty": royalty,
+        "depreciation": depreciation,
+        "tax": tax,
+        "cash_flow": cash_flow,
+    }
+
+@st.cache_data(show_spinner=False)
+def compute_fiscals(oil_price, production, capex, opex_per_bbl, depreciation_rate,
+                    royalty_rate, tax_rate, discount_rate, project_life):
+    fiscals = annual_cash_flow(oil_price, production, capex, opex_per_bbl, depreciation_rate,
+                               royalty_rate, tax_rate)
+    cash_flow = fiscals["cash_flow"]
+
+    # Create projection over project life
+    years = np.arange(1, project_life + 1)
+
+    # Every period carries the same cash flow, so NPV/IRR use the annuity closed form
+    # and no per-year discounted array is needed
+    r = discount_rate / 100
+    npv = float(annuity_pv(r, cash_flow, project_life)) - capex
+    irr = irr_annuity(capex, cash_flow, project_life) * 100
+
+    return {
+        **fiscals,
+        "years": years,
+        "npv": npv,
+        "irr": irr,
+    }
+
+@st.cache_data(show_spinner=False)
+def compute_sensitivity(oil_prices, discount_rates, production, capex, opex_per_bbl,
+                        depreciation_rate, royalty_rate, tax_rate, project_life):
+    """NPV grid over oil prices (rows) and discount rates (columns), in one broadcast."""
+    cash_flow = annual_cash_flow(oil_prices, production, capex, opex_per_bbl, depreciation_rate,
+                                 royalty_rate, tax_rate)["cash_flow"]
+
+    # Cash flow is constant per year, so each cell is the same annuity NPV as compute_fiscals
+    return annuity_pv(discount_rates[None, :] / 100, cash_flow[:, None], project_life) - capex
+
+results = compute_fiscals(oil_price, production, capex, opex_per_bbl, depreciation_rate,
+                          royalty_rate, tax_rate, discount_rate, project_life)
+revenue = results["revenue"]
+years = results["years"]
+npv = results["npv"]
+irr = results["irr"]
 
 # ----------------------
 # DASHBOARD DISPLAY
@@ -85,70 +188,118 @@ col2.metric("IRR (%)", f"{irr:,.2f}")
 col3.metric("Annual Revenue ($M)", f"{revenue:,.2f}")
 
 # Cash Flow Table
+# Every year is identical, so pandas broadcasts the scalars along the Year column
 st.subheader("Projected Annual Financials")
 data = pd.DataFrame({
     "Year": years,
-    "Revenue ($M)": revenues,
-    "OPEX ($M)": opex,
-    "Royalty ($M)": royalties,
-    "Depreciation ($M)": depreciations,
-    "Tax ($M)": taxes,
-    "Net Cash Flow ($M)": cash_flows
+    "Revenue ($M)": revenue,
+    "OPEX ($M)": results["opex_total"],
+    "Royalty ($M)": results["royalty"],
+    "Depreciation ($M)": results["depreciation"],
+    "Tax ($M)": results["tax"],
+    "Net Cash Flow ($M)": results["cash_flow"]
 })
-st.dataframe(data.style.format("{:.2f}"))
+# Let the Arrow renderer format numbers instead of building a Styler per rerun
+st.dataframe(
+    data,
+    column_config={col: st.column_config.NumberColumn(format="%.2f") for col in data.columns[1:]},
+    hide_index=True,
+)
 
 # Chart
 st.subheader("Net Cash Flow Over Project Life")
-st.line_chart(pd.DataFrame({"Year": years, "Net Cash Flow ($M)": cash_flows}).set_index("Year"))
+st.line_chart(data.set_index("Year")[["Net Cash Flow ($M)"]])
+
+# Sensitivity Heatmap
+st.subheader("NPV Sensitivity: Oil Price vs Discount Rate")
+sweep_oil_prices = np.round(np.linspace(0.5 * oil_price, 1.5 * oil_price, 21), 2)
+sweep_discount_rates = np.arange(5, 16)
+npv_grid = compute_sensitivity(sweep_oil_prices, sweep_discount_rates, production, capex,
+                               opex_per_bbl, depreciation_rate, royalty_rate, tax_rate,
+                               project_life)
+sensitivity = pd.DataFrame({
+    "Oil Price ($/bbl)": np.repeat(sweep_oil_prices, len(sweep_discount_rates)),
+    "Discount Rate (%)": np.tile(sweep_discount_rates, len(sweep_oil_prices)),
+    "NPV ($M)": npv_grid.ravel(),
+})
+st.altair_chart(
+    alt.Chart(sensitivity).mark_rect().encode(
+        x=alt.X("Discount Rate (%):O"),
+        y=alt.Y("Oil Price ($/bbl):O", sort="descending"),
+        color=alt.Color("NPV ($M):Q", scale=alt.Scale(scheme="redyellowgreen", domainMid=0)),
+        tooltip=["Oil Price ($/bbl)", "Discount Rate (%)", alt.Tooltip("NPV ($M):Q", format=",.2f")],
+    ),
+    width="stretch",
+)
 
 # ----------------------
 # PDF EXPORT WITH CHART
 # ----------------------
 st.subheader("Download PDF Report")
-# Generate chart image
-fig, ax = plt.subplots()
-ax.plot(years, cash_flows, marker='o', linestyle='-', color='green')
-ax.set_title("Net Cash Flow Over Project Life")
-ax.set_xlabel("Year")
-ax.set_ylabel("Cash Flow ($M)")
-ax.grid(True)
-chart_buffer = BytesIO()
-plt.savefig(chart_buffer, format='PNG')
-plt.close()
-chart_buffer.seek(0)
-chart_image = chart_buffer.read()
-image_path = "/tmp/cashflow_chart.png"
-with open(image_path, "wb") as f:
-    f.write(chart_image)
-
-pdf = FPDF()
-pdf.add_page()
-pdf.set_font("Arial", "B", 14)
-pdf.cell(200, 10, "Tilenga Fiscal Sensitivity Report", ln=True, align='C')
-pdf.set_font("Arial", "", 12)
-pdf.ln(10)
-pdf.cell(200, 10, f"Oil Price: ${oil_price:.2f}", ln=True)
-pdf.cell(200, 10, f"Production: {production:,} bbl/day", ln=True)
-pdf.cell(200, 10, f"CAPEX: ${capex:,} million", ln=True)
-pdf.cell(200, 10, f"OPEX: ${opex_per_bbl:.2f} per bbl", ln=True)
-pdf.cell(200, 10, f"Depreciation Rate: {depreciation_rate}%", ln=True)
-pdf.cell(200, 10, f"Royalty Rate: {royalty_rate}%", ln=True)
-pdf.cell(200, 10, f"Tax Rate: {tax_rate}%", ln=True)
-pdf.cell(200, 10, f"Discount Rate: {discount_rate}%", ln=True)
-pdf.cell(200, 10, f"Project Life: {project_life} years", ln=True)
-pdf.ln(10)
-pdf.set_font("Arial", "B", 12)
-pdf.cell(200, 10, "Key Results", ln=True)
-pdf.set_font("Arial", "", 12)
-pdf.cell(200, 10, f"NPV: ${npv:,.2f} million", ln=True)
-pdf.cell(200, 10, f"IRR: {irr:.2f}%", ln=True)
-pdf.cell(200, 10, f"Annual Revenue: ${revenue:,.2f} million", ln=True)
-pdf.image(image_path, x=10, y=None, w=180)
-
-pdf_output = pdf.output(dest='S').encode('latin1')
-st.download_button(
-    label="📄 Download Full PDF Report",
-    data=pdf_output,
-    file_name="Tilenga_Fiscal_Report_with_Cashflow.pdf",
-    mime="application/pdf"
-)
+
+@st.cache_data(show_spinner=False)
+def render_cashflow_chart(cash_flow, project_life):
+    """Render the cash flow chart to PNG bytes without touching pyplot's global state."""
+    from io import BytesIO
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.subplots()
+    ax.plot(range(1, project_life + 1), [cash_flow] * project_life, marker='o', linestyle='-', color='green')
+    ax.set_title("Net Cash Flow Over Project Life")
+    ax.set_xlabel("Year")
+    ax.set_ylabel("Cash Flow ($M)")
+    ax.grid(True)
+    chart_buffer = BytesIO()
+    fig.savefig(chart_buffer, format='PNG')
+    return chart_buffer.getvalue()
+
+@st.cache_data(show_spinner=False)
+def build_pdf_report(oil_price, production, capex, opex_per_bbl, depreciation_rate,
+                     royalty_rate, tax_rate, discount_rate, project_life,
+                     npv, irr, revenue, chart_png):
+    """Lay out the PDF report; identical inputs reuse the previously built bytes."""
+    # PDF dependencies are heavy to import, so only load them when a report is requested
+    from io import BytesIO
+    from fpdf import FPDF, XPos, YPos
+
+    chart_buffer = BytesIO(chart_png)
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("helvetica", "B", 14)
+    pdf.cell(200, 10, "Tilenga Fiscal Sensitivity Report", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
+    pdf.set_font("helvetica", "", 12)
+    pdf.ln(10)
+    pdf.cell(200, 10, f"Oil Price: ${oil_price:.2f}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(200, 10, f"Production: {production:,} bbl/day", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(200, 10, f"CAPEX: ${capex:,} million", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(200, 10, f"OPEX: ${opex_per_bbl:.2f} per bbl", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(200, 10, f"Depreciation Rate: {depreciation_rate}%", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(200, 10, f"Royalty Rate: {royalty_rate}%", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(200, 10, f"Tax Rate: {tax_rate}%", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(200, 10, f"Discount Rate: {discount_rate}%", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(200, 10, f"Project Life: {project_life} years", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.ln(10)
+    pdf.set_font("helvetica", "B", 12)
+    pdf.cell(200, 10, "Key Results", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.set_font("helvetica", "", 12)
+    pdf.cell(200, 10, f"NPV: ${npv:,.2f} million", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(200, 10, f"IRR: {irr:.2f}%", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(200, 10, f"Annual Revenue: ${revenue:,.2f} million", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.image(chart_buffer, x=10, y=None, w=180)
+
+    return bytes(pdf.output())
+
+if st.button("Generate PDF Report"):
+    chart_png = render_cashflow_chart(results["cash_flow"], project_life)
+    pdf_output = build_pdf_report(oil_price, production, capex, opex_per_bbl, depreciation_rate,
+                                  royalty_rate, tax_rate, discount_rate, project_life,
+                                  npv, irr, revenue, chart_png)
+    st.download_button(
+        label="📄 Download Full PDF Report",
+        data=pdf_output,
+        file_name="Tilenga_Fiscal_Report_with_Cashflow.pdf",
+        mime="application/pdf",
+        # Downloading must not rerun the script, or the button above resets and this one vanishes
+        on_click="ignore",
+    )